@@ -1,133 +1,217 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import os
 from pathlib import Path
 
 # ---- CONFIG ----
 FILE = "model_202402191144_eval_20240102_through_20240306_DF-Positions.txt"
 
 # ---- LOAD DATA ----
-df = pd.read_csv(FILE, parse_dates=["Time"])
-df.set_index("Time", inplace=True)
-date_list = sorted([d.to_pydatetime().date() for d in df.index.unique()])
-tickers = df.columns.tolist()
+def source_stamp(path):
+    stat = Path(path).stat()
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def read_parquet_cache(cache_path, stamp):
+    """Cached frame if it was written from exactly this source file, else None."""
+    try:
+        df = pd.read_parquet(cache_path, dtype_backend="pyarrow")
+    except Exception:       # missing, truncated or unreadable: re-parse the CSV
+        return None
+    return df if df.attrs.pop("source", None) == stamp else None
+
+def write_parquet_cache(df, cache_path, stamp):
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp.parquet")
+    df.attrs["source"] = stamp              # stored in the Parquet metadata
+    try:
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, cache_path)    # readers never see a half-written file
+    except OSError:
+        tmp_path.unlink(missing_ok=True)    # read-only data dir: the Parquet copy is only a speed-up
+    finally:
+        df.attrs.pop("source", None)
+
+@st.cache_resource(show_spinner=False)
+def load_positions(path):
+    """Parse the positions file once per session; reruns hit the cache.
+
+    The parsed frame is also written next to the file as Parquet and reused
+    on later starts only while the CSV's mtime and size match the ones
+    recorded with it. Cached as a resource so reruns share the frame by
+    reference rather than copying it; treat it as read-only.
+    """
+    cache_path = Path(path).with_suffix(".parquet")
+    stamp = source_stamp(path)
+    df = read_parquet_cache(cache_path, stamp)
+    if df is None:
+        df = pd.read_csv(path, parse_dates=["Time"], engine="pyarrow", dtype_backend="pyarrow")
+        df.set_index("Time", inplace=True)
+        write_parquet_cache(df, cache_path, stamp)
+    # both readers hand back an Arrow timestamp index; normalize()/.date need a DatetimeIndex
+    df.index = pd.DatetimeIndex(df.index.astype("datetime64[ns]"))
+    dates = df.index.normalize().unique().sort_values().date.tolist()
+    return df, dates, df.columns.tolist()
+
+df, date_list, tickers = load_positions(FILE)
+
+# ticker universe is fixed for the file, so equal-weight targets are too
+CASH_MASK  = pd.Index(tickers).str.lower().to_numpy() == "cash"
+N_NON_CASH = (~CASH_MASK).sum()
+EQ_W       = 1.0 / N_NON_CASH if N_NON_CASH else 0.0
+TARGETS    = pd.Series(np.where(CASH_MASK, 0.0, EQ_W), index=tickers)
 
 # ---- HELPERS ----
 pct = lambda x: f"{x:.2%}"
 
-def get_equal_weight_targets(snapshot):
-    non_cash = [t for t in snapshot.index if t.lower() != "cash"]
-    equal_wt = 1 / len(non_cash) if non_cash else 0
-    return {t: (0.0 if t.lower() == "cash" else equal_wt) for t in snapshot.index}
+@st.cache_data
+def snapshot_at(ts):
+    return df.loc[ts]
 
 # ---- HEADER ----
 st.title("📊 Portfolio Dashboard")
 
-# ---- SUMMARY SECTION ----
-selected_date = st.slider(
-    "Select Date for Snapshot",
+# ---- SHARED DATE ----
+selected_date = st.sidebar.slider(
+    "Date",
     min_value=min(date_list),
     max_value=max(date_list),
     value=max(date_list),
     format="YYYY-MM-DD"
 )
-snapshot = df.loc[pd.to_datetime(selected_date)]
-TARGET_WEIGHTS = get_equal_weight_targets(snapshot)
+sel_ts = pd.Timestamp(selected_date)
+snap = snapshot_at(sel_ts)
+
+def section_date(label, key):
+    """Shared sidebar timestamp unless the user opts into a per-section override."""
+    with st.expander(f"Override date for {label}"):
+        if st.checkbox("override date", key=f"{key}_override"):
+            return pd.Timestamp(st.slider(
+                f"Select Date for {label}",
+                min_value=min(date_list),
+                max_value=max(date_list),
+                value=selected_date,
+                format="YYYY-MM-DD",
+                key=key
+            ))
+    return sel_ts
 
+# ---- SUMMARY SECTION ----
 st.markdown("### Summary")
 st.markdown(f"- **Date**: {selected_date.strftime('%Y-%m-%d')}")
 st.markdown(f"- **Portfolio Value**: ${50_000:,.0f}")
-st.markdown(f"- **Cash %**: {pct(snapshot['Cash']) if 'Cash' in snapshot else '—'}")
+st.markdown(f"- **Cash %**: {pct(snap['Cash']) if 'Cash' in snap else '—'}")
 
-drift = (snapshot - pd.Series(TARGET_WEIGHTS))
+drift = (snap - TARGETS)
 needs_rebal = (drift.abs() > 0.02).any()
 st.markdown(f"- **Needs Rebalance**: {'Yes' if needs_rebal else 'No'}")
 
 # ---- PIE CHART SECTION ----
-st.markdown("### Allocation Pie")
-pie_date = st.slider(
-    "Select Date for Pie Chart",
-    min_value=min(date_list),
-    max_value=max(date_list),
-    value=max(date_list),
-    format="YYYY-MM-DD",
-    key="pie_date"
-)
-pie_snapshot = df.loc[pd.to_datetime(pie_date)]
-
-pie_fig = px.pie(
-    pie_snapshot.reset_index().rename(columns={"index": "Ticker", 0: "Weight"}),
-    names=pie_snapshot.index,
-    values=pie_snapshot.values,
-    hole=0.45
-)
-pie_fig.update_traces(textposition="inside", texttemplate="%{label}<br>%{percent:.1%}")
-st.plotly_chart(pie_fig)
-
-# ---- ALLOCATION TABLE ----
-st.markdown("### Allocation Table")
-table_date = st.slider(
-    "Select Date for Table",
-    min_value=min(date_list),
-    max_value=max(date_list),
-    value=max(date_list),
-    format="YYYY-MM-DD",
-    key="table_date"
-)
-
-# --- pull weights ----------------------------------------------------------
-table_snapshot = df.loc[pd.to_datetime(table_date)]
-total_w        = table_snapshot.sum()                        # <-- NEW (denominator)
-targets        = pd.Series(get_equal_weight_targets(table_snapshot))
-
-table_df = table_snapshot.to_frame("Current")
-table_df["Target"] = targets
-table_df["Drift"]  = table_df["Current"] - table_df["Target"]
-
-# --- percentage formatting -------------------------------------------------
-table_df["Current%"] = (table_df["Current"] / total_w).apply(pct)
-table_df["Target%"]  = (table_df["Target"]  / total_w).apply(pct)
-table_df["Drift%"]   = (table_df["Drift"]   / total_w).apply(pct)
+@st.cache_data
+def build_pie(ts):
+    pie_snapshot = snapshot_at(ts)
+    pie_fig = px.pie(
+        names=pie_snapshot.index,
+        values=pie_snapshot.to_numpy(),
+        hole=0.45
+    )
+    pie_fig.update_traces(textposition="inside", texttemplate="%{label}<br>%{percent:.1%}")
+    return pie_fig
 
-# --- dollar exposure -------------------------------------------------------
-table_df["$"] = (table_df["Current"] * 50_000).apply(lambda x: f"{x:,.2f}")
+@st.fragment
+def pie_section():
+    st.markdown("### Allocation Pie")
+    pie_date = section_date("Pie Chart", "pie_date")
 
-# --- render ----------------------------------------------------------------
-st.dataframe(table_df[["Current%", "Target%", "Drift%", "$"]])
+    st.plotly_chart(build_pie(pie_date))
+pie_section()
 
+# ---- ALLOCATION TABLE ----
+@st.fragment
+def table_section():
+    st.markdown("### Allocation Table")
+    table_date = section_date("Table", "table_date")
+
+    # --- pull weights ------------------------------------------------------
+    table_snapshot = snapshot_at(table_date)
+    total_w        = table_snapshot.sum()                        # <-- NEW (denominator)
+
+    table_df = table_snapshot.to_frame("Current")
+    table_df["Target"] = TARGETS
+    table_df["Drift"]  = table_df["Current"] - table_df["Target"]
+
+    # --- percentages (kept numeric, formatted client-side) -----------------
+    table_df["Current%"] = table_df["Current"] / total_w * 100
+    table_df["Target%"]  = table_df["Target"]  / total_w * 100
+    table_df["Drift%"]   = table_df["Drift"]   / total_w * 100
+
+    # --- dollar exposure ---------------------------------------------------
+    table_df["$"] = table_df["Current"] * 50_000
+
+    # --- render ------------------------------------------------------------
+    pct_col = st.column_config.NumberColumn(format="%.2f%%")
+    st.dataframe(
+        table_df[["Current%", "Target%", "Drift%", "$"]],
+        column_config={
+            "Current%": pct_col,
+            "Target%":  pct_col,
+            "Drift%":   pct_col,
+            "$":        st.column_config.NumberColumn(format="dollar"),
+        },
+    )
+table_section()
 
 
 # ---- ALLOCATION HISTORY ----
 TOP_N = 8
-top_cols = snapshot.sort_values(ascending=False).head(TOP_N).index
-hist = df[top_cols]
+HISTORY_MAX_POINTS = 1000
+
+def downsample_history(hist, max_points=HISTORY_MAX_POINTS):
+    """Average rows into max_points equal-size bins on one shared time grid.
+
+    This is lossy: st.plotly_chart has no relayout callback, so zooming in
+    does not bring the dropped detail back. Histories at or under max_points
+    rows are returned untouched. Every ticker keeps the same x values, so the
+    stacked bands built from the cumsum stay aligned.
+    """
+    if len(hist) <= max_points:
+        return hist
+    bins   = np.arange(len(hist)) * max_points // len(hist)
+    binned = hist.groupby(bins).mean()
+    binned.index = hist.index[np.flatnonzero(np.diff(bins, prepend=-1))]
+    return binned
+
+@st.cache_data
+def top_n_cols(ts, n=TOP_N):
+    return tuple(snapshot_at(ts).nlargest(n).index)
+
+@st.cache_data
+def build_history_fig(top_cols_tuple):
+    top_cols = list(top_cols_tuple)
+    hist = downsample_history(df[top_cols])
+    cum  = hist.cumsum(axis=1)             # Scattergl has no stackgroup, so stack by hand
+    stack = go.Figure()
+    for i, col in enumerate(top_cols):
+        stack.add_trace(
+            go.Scattergl(
+                x=hist.index,
+                y=cum[col].to_numpy(),
+                name=col, mode="lines",
+                fill="tozeroy" if i == 0 else "tonexty",
+                hovertext=hist[col].map(pct).to_numpy(),
+                hovertemplate="%{x|%Y-%m-%d}<br>%{hovertext}",
+            )
+        )
+    stack.update_layout(title="Allocation History", yaxis_title="Weight", legend_title="Ticker")
+    stack.update_yaxes(tickformat=".0%", range=[0, 1])
+    return stack
 
+# no widgets of its own (it follows the sidebar date), so not a fragment
 st.markdown("### Allocation History")
-stack = px.area(hist.reset_index(), x="Time", y=top_cols,
-                labels={"value": "Weight", "variable": "Ticker"},
-                title="Allocation History")
-stack.update_yaxes(tickformat=".0%", range=[0, 1])
-st.plotly_chart(stack)
+st.plotly_chart(build_history_fig(top_n_cols(sel_ts)))
 
 # ---- DRIFT MONITOR (colour-aware, with legend) ----
-st.markdown("### Drift Monitor")
-
-# --- user inputs -----------------------------------------------------------
-drift_date = st.slider(
-    "Select Date for Drift Monitor",
-    min_value=min(date_list), max_value=max(date_list),
-    value=max(date_list), format="YYYY-MM-DD", key="drift_date"
-)
-drift_band = st.slider(
-    "Drift Threshold (±)", 0.0, 0.10, 0.02, step=0.005, key="drift_slider"
-)
-
-# --- data prep -------------------------------------------------------------
-snapshot = df.loc[pd.to_datetime(drift_date)]
-targets  = pd.Series(get_equal_weight_targets(snapshot))
-drift    = snapshot - targets                        # +  sell • –  buy
-
 def colour_for(val, band):
     abs_val = abs(val)
     if val >= 0:               # SELL palette
@@ -139,22 +223,38 @@ def colour_for(val, band):
         elif abs_val > band*0.5:   return "dodgerblue"
         else:                      return "lightskyblue"
 
-colours = [colour_for(v, drift_band) for v in drift]
-
-# --- main bar trace --------------------------------------------------------
-fig = go.Figure(
-    go.Bar(
-        x=drift.values,
-        y=drift.index,
-        orientation="h",
-        marker_color=colours,
-        hovertemplate="%{y}<br>Drift: %{x:.2%}<extra></extra>",
-        showlegend=False,           # keep bar itself out of legend
+@st.cache_data
+def build_drift_fig(ts, band):
+    # --- data prep ---------------------------------------------------------
+    snapshot = snapshot_at(ts)
+    drift    = snapshot - TARGETS                    # +  sell • –  buy
+    drift    = drift[drift != 0]                     # zero-drift bars add nothing
+
+    colours = [colour_for(v, band) for v in drift]
+
+    # --- main bar trace ----------------------------------------------------
+    fig = go.Figure(
+        go.Bar(
+            x=drift.to_numpy(),
+            y=drift.index,
+            orientation="h",
+            marker_color=colours,
+            hovertemplate="%{y}<br>Drift: %{x:.2%}<extra></extra>",
+            showlegend=False,
+        )
     )
-)
-fig.add_vline(x=0, line_width=1, line_color="white")
+    fig.add_vline(x=0, line_width=1, line_color="white")
+
+    # --- layout tweaks -----------------------------------------------------
+    fig.update_layout(
+        height=600,
+        xaxis_title="Weight drift (Current − Target)",
+        xaxis_tickformat=".1%",
+        yaxis_title="",
+    )
+    return fig
 
-# --- dummy traces for legend ----------------------------------------------
+# --- static legend (HTML, so the figure carries no dummy traces) -----------
 legend_items = [
     ("Buy urgent (>|band|)",     "midnightblue"),
     ("Buy watch (0.5–1×)",       "dodgerblue"),
@@ -163,77 +263,59 @@ legend_items = [
     ("Sell watch (0.5–1×)",      "tomato"),
     ("Sell minor (<0.5×)",       "lightsalmon"),
 ]
+legend_html = "**Tier key**<br>" + "<br>".join(
+    f'<span style="color:{color}">&#9679;</span> {name}' for name, color in legend_items
+)
 
-for name, color in legend_items:
-    fig.add_trace(
-        go.Scatter(
-            x=[None], y=[None],                # no visible data
-            mode="markers",
-            marker=dict(size=10, color=color),
-            showlegend=True,
-            name=name,
-            legendgroup=name,
-        )
-    )
+@st.fragment
+def drift_section():
+    st.markdown("### Drift Monitor")
 
-# --- layout tweaks ---------------------------------------------------------
-fig.update_layout(
-    height=600,
-    xaxis_title="Weight drift (Current − Target)",
-    xaxis_tickformat=".1%",
-    yaxis_title="",
-    legend=dict(
-        title="Tier key",
-        borderwidth=0,
-        orientation="v",          # vertical; set "h" for horizontal
-        yanchor="top", y=1, xanchor="left", x=1.02  # place to the right
-    ),
-)
+    # --- user inputs -------------------------------------------------------
+    drift_date = section_date("Drift Monitor", "drift_date")
+    drift_band = st.slider(
+        "Drift Threshold (±)", 0.0, 0.10, 0.02, step=0.005, key="drift_slider"
+    )
 
-st.plotly_chart(fig)
+    chart_col, legend_col = st.columns([4, 1])
+    with chart_col:
+        st.plotly_chart(build_drift_fig(drift_date, drift_band))
+    with legend_col:
+        st.markdown(legend_html, unsafe_allow_html=True)
+drift_section()
 
 # ---- TRADE SUGGESTIONS ----
-st.markdown("### Trade Suggestions")
-trade_date = st.slider(
-    "Select Date for Trade Suggestions",
-    min_value=min(date_list),
-    max_value=max(date_list),
-    value=max(date_list),
-    format="YYYY-MM-DD",
-    key="trade_date"
-)
-drift_band_trade = st.slider("Trade Drift Band", 0.0, 0.1, 0.02, step=0.005, key="trade_drift")
-portfolio_val_trade = st.number_input("Portfolio Value for Trades", value=50_000, step=500)
-
-trade_snapshot = df.loc[pd.to_datetime(trade_date)]
-TARGET_WEIGHTS = get_equal_weight_targets(trade_snapshot)
-
-dollar_drift = (trade_snapshot - pd.Series(TARGET_WEIGHTS)) * portfolio_val_trade
-buy_actions, sell_actions = [], []
-
-for t, dv in dollar_drift.items():
-    if abs(dv) > portfolio_val_trade * drift_band_trade:
-        action = "Buy" if dv < 0 else "Sell"
-        line = f"{action} ${abs(dv):,.0f} {t}"
-        if action == "Buy":
-            buy_actions.append(line)
-        else:
-            sell_actions.append(line)
-
-col1, col2 = st.columns(2)
-with col1:
-    st.subheader("📈 Buy")
-    st.code("\n".join(buy_actions) if buy_actions else "No Buy suggestions.")
-with col2:
-    st.subheader("📉 Sell")
-    st.code("\n".join(sell_actions) if sell_actions else "No Sell suggestions.")
-
-# ---- DOWNLOAD TRADES ----
-if buy_actions or sell_actions:
-    combined_actions = "\n".join(buy_actions + sell_actions)
-    st.download_button(
-        label="💾 Download Trade Suggestions",
-        data=combined_actions,
-        file_name="trade_suggestions.txt",
-        mime="text/plain"
-    )
+@st.fragment
+def trade_section():
+    st.markdown("### Trade Suggestions")
+    trade_date = section_date("Trade Suggestions", "trade_date")
+    drift_band_trade = st.slider("Trade Drift Band", 0.0, 0.1, 0.02, step=0.005, key="trade_drift")
+    portfolio_val_trade = st.number_input("Portfolio Value for Trades", value=50_000, step=500)
+
+    trade_snapshot = snapshot_at(trade_date)
+
+    dollar_drift = (trade_snapshot - TARGETS) * portfolio_val_trade
+    actionable = dollar_drift[dollar_drift.abs() > portfolio_val_trade * drift_band_trade]
+    buys  = actionable[actionable < 0]
+    sells = actionable[actionable >= 0]
+    buy_actions  = [f"Buy ${abs(dv):,.0f} {t}" for t, dv in buys.items()]
+    sell_actions = [f"Sell ${dv:,.0f} {t}" for t, dv in sells.items()]
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("📈 Buy")
+        st.code("\n".join(buy_actions) if buy_actions else "No Buy suggestions.")
+    with col2:
+        st.subheader("📉 Sell")
+        st.code("\n".join(sell_actions) if sell_actions else "No Sell suggestions.")
+
+    # ---- DOWNLOAD TRADES ----
+    if buy_actions or sell_actions:
+        combined_actions = "\n".join(buy_actions + sell_actions)
+        st.download_button(
+            label="💾 Download Trade Suggestions",
+            data=combined_actions,
+            file_name="trade_suggestions.txt",
+            mime="text/plain"
+        )
+trade_section()